@@ -0,0 +1,187 @@
+import argparse
+import json
+import platform
+import random
+import sys
+from itertools import cycle
+from statistics import median, quantiles
+from time import perf_counter
+
+from lib import circuit
+from lib.netlist import load
+from lib.sim import EventCircuit, FlatCircuit, compile_to_python, evaluate_batch, evaluate_bits, np
+
+CIRCUITS = ("NOR", "NAND", "XOR", "AND3", "OR3", "XNOR", "ODD", "MT1", "HADD", "ADD", "SC",
+            "NOT8", "AND8", "OR8", "EQ8", "NEQ8", "GT8", "LT8", "GTE8", "LTE8", "ADD8", "ALU")
+TIMES = ("construct", "construct_flat", "tick")
+WIDTH = 1 << 12
+
+
+def timed(step, budget):
+    count = 0
+    start = perf_counter()
+    while True:
+        count += step()
+        elapsed = perf_counter() - start
+        if elapsed >= budget:
+            return count / elapsed
+
+
+def vectors(n, count, seed=0):
+    rng = random.Random(seed)
+    return [{f"in{k + 1}": rng.getrandbits(1) for k in range(n)} for _ in range(count)]
+
+
+def engines(cls, n, budget):
+    samples = cycle(vectors(n, 256))
+    rows = cycle([list(v.values()) for v in vectors(n, 256)])
+    rng = random.Random(0)
+    lanes = {f"in{k + 1}": rng.getrandbits(WIDTH) for k in range(n)}
+    mask = (1 << WIDTH) - 1
+    f = compile_to_python(cls)
+
+    def stepper(c):
+        def step():
+            c.set_inputs(**next(samples))
+            c.run()
+            return 1
+        return step
+
+    def bits():
+        evaluate_bits(cls, lanes, WIDTH)
+        return WIDTH
+
+    def compiled():
+        f(*next(rows))
+        return 1
+
+    def compiled_bits():
+        f(*lanes.values(), mask=mask)
+        return WIDTH
+
+    steps = {
+        "legacy": stepper(cls()),
+        "flat": stepper(FlatCircuit(cls)),
+        "event": stepper(EventCircuit(cls)),
+        "bits": bits,
+        "compiled": compiled,
+        "compiled_bits": compiled_bits,
+    }
+    if np is not None:
+        block = np.array([list(v.values()) for v in vectors(n, WIDTH)], dtype=np.uint8)
+
+        def batch():
+            evaluate_batch(cls, block)
+            return WIDTH
+        steps["batch"] = batch
+    return {name: timed(step, budget) for name, step in steps.items()}
+
+
+def measure(cls, budget=0.2):
+    n = len(load(cls).inputs)
+    c = cls()
+
+    def construct():
+        cls()
+        return 1
+
+    def construct_flat():
+        FlatCircuit(cls)
+        return 1
+
+    def tick():
+        c.update()
+        return 1
+
+    settled = []
+    for v in vectors(n, 16, seed=1):
+        c.set_inputs(**v)
+        settled.append(c.run())
+    return {
+        "inputs": n,
+        "outputs": len(load(cls).outputs),
+        "construct": 1 / timed(construct, budget),
+        "construct_flat": 1 / timed(construct_flat, budget),
+        "tick": 1 / timed(tick, budget),
+        "settle_ticks": cls.settle_ticks(),
+        "ticks": {"mean": sum(settled) / len(settled), "max": max(settled)},
+        "vectors_per_second": engines(cls, n, budget),
+    }
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    q1, q2, q3 = quantiles(samples, n=4) if len(samples) > 1 else samples * 3
+    return {"median": median(samples), "iqr": q3 - q1, "samples": samples}
+
+
+def report(names=CIRCUITS, budget=0.2, repeat=1):
+    circuits = {}
+    for name in names:
+        runs = [measure(getattr(circuit, name), budget) for _ in range(repeat)]
+        res = circuits[name] = runs[0]
+        for key in TIMES:
+            res[key] = summarize([r[key] for r in runs])
+        for key in res["vectors_per_second"]:
+            res["vectors_per_second"][key] = summarize([r["vectors_per_second"][key] for r in runs])
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "budget": budget,
+        "repeat": repeat,
+        "circuits": circuits,
+    }
+
+
+def metrics(res):
+    for key in TIMES:
+        if key in res:
+            yield key, res[key], False
+    for key, value in res["vectors_per_second"].items():
+        yield f"vectors_per_second.{key}", value, True
+
+
+def compare(baseline, current, threshold=0.25):
+    regressions = []
+    for name, res in current["circuits"].items():
+        if name not in baseline["circuits"]:
+            continue
+        base = dict((key, value) for key, value, _ in metrics(baseline["circuits"][name]))
+        for key, value, higher in metrics(res):
+            if key not in base:
+                continue
+            old, new = base[key]["median"], value["median"]
+            slowdown = old / new if higher else new / old
+            noise = max(base[key]["iqr"], value["iqr"])
+            if slowdown > 1 + threshold and abs(new - old) > noise:
+                regressions.append(f"{name} {key}: {old:.4g} -> {new:.4g} ({slowdown:.2f}x slower)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m lib.bench")
+    parser.add_argument("circuits", nargs="*", default=CIRCUITS)
+    parser.add_argument("--budget", type=float, default=0.2, help="seconds spent on each measurement")
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs summarized by median and IQR")
+    parser.add_argument("-o", "--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="compare against this JSON report and exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before failing (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+    res = report(args.circuits, args.budget, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(res, f, indent=2)
+    else:
+        json.dump(res, sys.stdout, indent=2)
+        print()
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), res, args.threshold)
+        for line in regressions:
+            print(line, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
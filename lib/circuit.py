@@ -1,32 +1,57 @@
-from lib.core import C, Input, Output
+from lib.core import C, Input, NetStore, Output
+from lib.netlist import flatten, gate_stats, load, tick_depth
+from lib.profiler import Profiler
+from lib.sim import MAX_TICKS, FlatCircuit, evaluate_batch
 from lib.utils import CircuitError
 
+_TICKS = {}
+
+
+def _ports(contacts):
+    inputs, created, outputs = [], [], []
+    for name, contact in contacts.items():
+        if name.startswith('in'):
+            inputs.append(name)
+            if contact is None:
+                created.append(name)
+        elif name.startswith('out'):
+            outputs.append(name)
+        else:
+            raise CircuitError("Bad contacts name")
+    outputs.sort(key=lambda n: int(n[3:]))
+    return frozenset(inputs), tuple(created), tuple(outputs)
+
 
 class Circuit:
     ELEMENTS = {}
-
-    def __init__(self, **kwargs):
-        self._init = kwargs
-        self._elements = []
+    GATE = None
+    _init = {}
+    _flat = None
+    _wires = None
+    _root = False
+
+    def __init__(self, store=None, **kwargs):
+        if store is None:
+            store = NetStore()
+            self._root = True
+            self._init = kwargs
+        self._store = store
+        elements = []
         for elem, names in self.ELEMENTS.items():
             for n in names:
-                e = elem()
-                self._elements.append(e)
+                e = elem(store)
+                elements.append(e)
                 setattr(self, n, e)
-        self._input_names = []
-        for name, contact in self.inout().items():
-            if not (name.startswith('in') or name.startswith('out')):
-                raise CircuitError("Bad contacts name")
-            if contact:
-                setattr(self, name, contact)
-            elif name.startswith("in"):
-                setattr(self, name, Input())
-                self._input_names.append(name)
-            else:
-                setattr(self, name, Output())
-        self._conductors = []
-        for c in self.connect():
-            self._conductors.append(C(*c))
+        self._elements = tuple(elements)
+        contacts = self.inout()
+        cls = type(self)
+        if "_outputs" not in vars(cls):
+            cls._inputs, cls._input_names, cls._outputs = _ports(contacts)
+        for name, contact in contacts.items():
+            if contact is None:
+                contact = Input(store) if name.startswith('in') else Output(store)
+            setattr(self, name, contact)
+        self._conductors = tuple([C(*c) for c in self.connect()])
 
     def inout(self):
         return {}
@@ -48,12 +73,88 @@ class Circuit:
         for n in self._input_names:
             getattr(self, n).update()
 
-    def run(self, n=100):
-        for _ in range(n):
+    def walk(self):
+        yield self
+        for e in self._elements:
+            yield from e.walk()
+
+    def profile(self):
+        return Profiler(self)
+
+    def set_inputs(self, **kwargs):
+        if self._init is Circuit._init:
+            self._init = {}
+        for n, value in kwargs.items():
+            if n not in self._inputs:
+                raise CircuitError(f"Unknown input {n}")
+            self._init[n] = value
+
+    def read_outputs(self):
+        return [getattr(self, n).value for n in self._outputs]
+
+    def reset(self):
+        values = self._store.values
+        values[:] = bytes(len(values))
+
+    @classmethod
+    def settle_ticks(cls):
+        if cls not in _TICKS:
+            try:
+                _TICKS[cls] = tick_depth(cls) + 1
+            except CircuitError:
+                _TICKS[cls] = MAX_TICKS
+        return _TICKS[cls]
+
+    def run(self, max_ticks=None, strict=False, n=None):
+        if n is not None:
+            max_ticks = n
+        if max_ticks is None:
+            max_ticks = self.settle_ticks()
+        values = self._store.values
+        for i in range(max_ticks):
+            before = bytes(values)
             self.update()
+            if values == before:
+                return i + 1
+        if strict:
+            raise CircuitError(f"{type(self).__name__} did not settle in {max_ticks} ticks")
+        return max_ticks
+
+    @classmethod
+    def netlist(cls):
+        return load(cls)
+
+    @classmethod
+    def stats(cls):
+        return gate_stats(cls)
+
+    @classmethod
+    def evaluate_batch(cls, inputs):
+        return evaluate_batch(load(cls), inputs)
+
+    def run_levelized(self):
+        if self._flat is None:
+            self._flat = FlatCircuit(load(type(self)) if self._root else flatten(self))
+        self._flat._init = self._init
+        self._flat.values[:] = self._store.values
+        self._flat.run_levelized()
+        values = self._flat.values
+        for net, rep in self._flat.netlist.aliases.items():
+            values[net] = values[rep]
+        if self._wires is None:
+            self._wires = [(c.net, c.sources) for e in self.walk() for c in e._conductors]
+        for net, sources in self._wires:
+            x = 0
+            for i in sources:
+                x |= values[i]
+            values[net] = x
+        self._store.values[:] = values
+        return 1
 
 
 class Bridge(Circuit):
+    GATE = "Bridge"
+
     def inout(self):
         return {
             "in1": None,
@@ -66,6 +167,8 @@ class Bridge(Circuit):
 
 
 class NOT(Circuit):
+    GATE = "NOT"
+
     def inout(self):
         return {
             "in1": None,
@@ -78,6 +181,8 @@ class NOT(Circuit):
 
 
 class AND(Circuit):
+    GATE = "AND"
+
     def inout(self):
         return {
             "in1": None,
@@ -91,6 +196,8 @@ class AND(Circuit):
 
 
 class OR(Circuit):
+    GATE = "OR"
+
     def inout(self):
         return {
             "in1": None,
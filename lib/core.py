@@ -1,37 +1,112 @@
-class Contact:
+from lib.utils import CircuitError
+
+
+class NetStore:
     def __init__(self):
-        self.conductors = []
-        self.value = 0
+        self.values = bytearray()
+
+
+class Net:
+    __slots__ = ("store", "net")
+
+    def __init__(self, store=None):
+        if store is None:
+            store = NetStore()
+        values = store.values
+        self.store = store
+        self.net = len(values)
+        values.append(0)
+
+    @property
+    def value(self):
+        return self.store.values[self.net]
+
+    @value.setter
+    def value(self, value):
+        self.store.values[self.net] = value
+
+
+class Contact(Net):
+    __slots__ = ("conductors",)
+
+    def __init__(self, store=None):
+        if store is None:
+            store = NetStore()
+        values = store.values
+        self.store = store
+        self.net = len(values)
+        values.append(0)
+        self.conductors = ()
 
     def addConductor(self, c):
-        self.conductors.append(c)
+        self.conductors += (c,)
 
 
 class Input(Contact):
+    __slots__ = ("sources",)
+
+    def __init__(self, store=None):
+        if store is None:
+            store = NetStore()
+        values = store.values
+        self.store = store
+        self.net = len(values)
+        values.append(0)
+        self.conductors = ()
+        self.sources = ()
+
+    def addConductor(self, c):
+        self.conductors += (c,)
+        self.sources += (c.net,)
+
     def update(self):
-        try:
-            self.value = max([c.value for c in self.conductors])
-        except Exception:
-            pass
+        sources = self.sources
+        if len(sources) == 1:
+            v = self.store.values
+            v[self.net] = v[sources[0]]
+        elif sources:
+            v = self.store.values
+            x = 0
+            for s in sources:
+                x |= v[s]
+            v[self.net] = x
 
 
 class Output(Contact):
-    pass
+    __slots__ = ()
+
 
+class BaseConductor(Net):
+    __slots__ = ("sources",)
 
-class BaseConductor:
     def __init__(self, *contacts):
-        self.contacts = []
+        store = contacts[0].store
+        values = store.values
+        self.store = store
+        self.net = len(values)
+        values.append(0)
+        sources = []
         for c in contacts:
+            if c.store is not store:
+                raise CircuitError("Conductor joins contacts of different circuits")
             if isinstance(c, Output):
-                self.contacts.append(c)
+                sources.append(c.net)
             else:
                 c.addConductor(self)
-        self.value = 0
+        self.sources = tuple(sources)
 
     def update(self):
-        self.value = max([c.value for c in self.contacts])
+        sources = self.sources
+        if len(sources) == 1:
+            v = self.store.values
+            v[self.net] = v[sources[0]]
+        elif sources:
+            v = self.store.values
+            x = 0
+            for s in sources:
+                x |= v[s]
+            v[self.net] = x
 
 
 class C(BaseConductor):
-    pass
+    __slots__ = ()
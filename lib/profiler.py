@@ -0,0 +1,85 @@
+from time import perf_counter
+
+
+class Stats:
+    __slots__ = ("path", "name", "conductors", "calls", "total", "self")
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        self.conductors = 0
+        self.calls = 0
+        self.total = 0.0
+        self.self = 0.0
+
+    def __repr__(self):
+        return f"{self.path} ({self.name}): {self.calls} calls, {self.total:.6f}s total, {self.self:.6f}s self, " \
+               f"{self.conductors} conductor updates"
+
+
+class Profiler:
+    def __init__(self, circuit):
+        self.circuit = circuit
+        self.stats = {}
+        self._stack = []
+        self._patched = []
+
+    def _wrap(self, c, stats):
+        update = c.update
+        conductors = len(c._conductors)
+        stack = self._stack
+
+        def timed():
+            stack.append(0.0)
+            start = perf_counter()
+            update()
+            elapsed = perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            stats.calls += 1
+            stats.conductors += conductors
+            stats.total += elapsed
+            stats.self += elapsed - children
+        return timed
+
+    def _walk(self, c, path):
+        yield c, path
+        for names in c.ELEMENTS.values():
+            for n in names:
+                yield from self._walk(getattr(c, n), f"{path}.{n}")
+
+    def __enter__(self):
+        for c, path in self._walk(self.circuit, type(self.circuit).__name__):
+            if path not in self.stats:
+                self.stats[path] = Stats(path, type(c).__name__)
+            c.update = self._wrap(c, self.stats[path])
+            self._patched.append(c)
+        return self
+
+    def __exit__(self, *exc):
+        for c in self._patched:
+            del c.update
+        self._patched = []
+
+    def report(self):
+        return sorted(self.stats.values(), key=lambda s: s.self, reverse=True)
+
+    def by_class(self):
+        classes = {}
+        for s in self.stats.values():
+            if s.name not in classes:
+                classes[s.name] = Stats(s.name, s.name)
+            total = classes[s.name]
+            total.calls += s.calls
+            total.total += s.total
+            total.self += s.self
+            total.conductors += s.conductors
+        return sorted(classes.values(), key=lambda s: s.self, reverse=True)
+
+    def format(self, limit=20, per_class=False):
+        rows = self.by_class() if per_class else self.report()
+        lines = [f"{'self s':>10} {'total s':>10} {'calls':>8} {'conductors':>10}  path"]
+        for s in rows[:limit]:
+            lines.append(f"{s.self:10.6f} {s.total:10.6f} {s.calls:8} {s.conductors:10}  {s.path}")
+        return "\n".join(lines)
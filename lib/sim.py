@@ -0,0 +1,406 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from heapq import heappop, heappush
+from itertools import product
+from weakref import WeakKeyDictionary
+
+from lib.netlist import load
+from lib.utils import CircuitError
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAX_TICKS = 100
+
+_PLANS = WeakKeyDictionary()
+_PROGRAMS = WeakKeyDictionary()
+_FUNCTIONS = WeakKeyDictionary()
+
+
+def evaluate(gates, v):
+    changed = False
+    for kind, ins, out, table in gates:
+        if kind == "AND":
+            x = v[ins[0]] & v[ins[1]]
+        elif kind == "OR":
+            x = v[ins[0]] | v[ins[1]]
+        elif kind == "NOT":
+            x = v[ins[0]] ^ 1
+        elif kind == "LUT":
+            x = table >> sum(v[i] << n for n, i in enumerate(ins)) & 1
+        else:
+            x = 0
+            for i in ins:
+                x |= v[i]
+        if v[out] != x:
+            v[out] = x
+            changed = True
+    return changed
+
+
+class Program:
+    def __init__(self, netlist):
+        self.gates = [(g.kind, g.ins, g.out, g.table) for g in netlist.gates]
+        rank = {}
+        try:
+            levels = netlist.levels()
+        except CircuitError:
+            self.order = None
+        else:
+            self.order = [(g.kind, g.ins, g.out, g.table) for level in levels for g in level]
+            for n, level in enumerate(levels):
+                for g in level:
+                    rank[g.out] = n
+        self.rank = [rank.get(g[2], 0) for g in self.gates]
+        self.fanout = [[] for _ in range(netlist.size)]
+        for n, g in enumerate(self.gates):
+            for i in set(g[1]):
+                self.fanout[i].append(n)
+        self.queue = sorted((r, n) for n, r in enumerate(self.rank))
+        self.values = bytearray(netlist.size)
+
+
+def program(circuit):
+    netlist = load(circuit)
+    if netlist not in _PROGRAMS:
+        _PROGRAMS[netlist] = Program(netlist)
+    return netlist, _PROGRAMS[netlist]
+
+
+class FlatCircuit:
+    def __init__(self, circuit, **kwargs):
+        self.netlist, self._program = program(circuit)
+        self._init = kwargs
+        self._gates = self._program.gates
+        self._order = self._program.order
+        self.values = bytearray(self._program.values)
+
+    def set_inputs(self, **kwargs):
+        for n, value in kwargs.items():
+            if n not in self.netlist.inputs:
+                raise CircuitError(f"Unknown input {n}")
+            self._init[n] = value
+
+    def read_outputs(self):
+        return [self.values[i] for i in self.netlist.outputs.values()]
+
+    def reset(self):
+        self.values = bytearray(self._program.values)
+
+    def _apply(self):
+        v = self.values
+        changed = False
+        for n, value in self._init.items():
+            if n.startswith('in'):
+                i = self.netlist.inputs[n]
+                changed = changed or v[i] != int(value)
+                v[i] = int(value)
+        return changed
+
+    def _show(self):
+        for n, value in self._init.items():
+            if n.startswith('out'):
+                value.value = self.values[self.netlist.outputs[n]]
+
+    def update(self):
+        self._show()
+        changed = self._apply()
+        return evaluate(self._gates, self.values) or changed
+
+    def run(self, max_ticks=None, strict=False, n=None):
+        if self._order is not None:
+            return self.run_levelized()
+        if n is not None:
+            max_ticks = n
+        if max_ticks is None:
+            max_ticks = MAX_TICKS
+        for i in range(max_ticks):
+            if not self.update():
+                return i + 1
+        if strict:
+            raise CircuitError(f"{self.netlist.name} did not settle in {max_ticks} ticks")
+        return max_ticks
+
+    def run_levelized(self):
+        if self._order is None:
+            raise CircuitError(f"{self.netlist.name} has a combinational loop")
+        self._apply()
+        evaluate(self._order, self.values)
+        self._show()
+        return 1
+
+
+class EventCircuit:
+    def __init__(self, circuit, **kwargs):
+        self.netlist, self._program = program(circuit)
+        self._init = kwargs
+        self._gates = self._program.gates
+        self._rank = self._program.rank
+        self._fanout = self._program.fanout
+        self.reset()
+        self.events = 0
+
+    def _touch(self, net):
+        for n in self._fanout[net]:
+            if n not in self._pending:
+                self._pending.add(n)
+                heappush(self._queue, (self._rank[n], n))
+
+    def set_inputs(self, **kwargs):
+        for n, value in kwargs.items():
+            if n not in self.netlist.inputs:
+                raise CircuitError(f"Unknown input {n}")
+            self._init[n] = value
+
+    def read_outputs(self):
+        return [self.values[i] for i in self.netlist.outputs.values()]
+
+    def reset(self):
+        self.values = bytearray(self._program.values)
+        self._queue = self._program.queue[:]
+        self._pending = set(range(len(self._gates)))
+
+    def _apply(self):
+        v = self.values
+        for n, value in self._init.items():
+            if n.startswith('in'):
+                i = self.netlist.inputs[n]
+                if v[i] != int(value):
+                    v[i] = int(value)
+                    self._touch(i)
+
+    def _show(self):
+        for n, value in self._init.items():
+            if n.startswith('out'):
+                value.value = self.values[self.netlist.outputs[n]]
+
+    def run(self, max_ticks=None, strict=False, n=None):
+        if n is not None:
+            max_ticks = n
+        if max_ticks is None:
+            max_ticks = MAX_TICKS
+        max_events = max_ticks * len(self._gates)
+        self._apply()
+        v = self.values
+        gates = self._gates
+        queue = self._queue
+        pending = self._pending
+        events = 0
+        while queue:
+            if events >= max_events:
+                if strict:
+                    raise CircuitError(f"{self.netlist.name} did not settle in {max_events} events")
+                break
+            n = heappop(queue)[1]
+            pending.discard(n)
+            events += 1
+            kind, ins, out, table = gates[n]
+            if kind == "AND":
+                x = v[ins[0]] & v[ins[1]]
+            elif kind == "OR":
+                x = v[ins[0]] | v[ins[1]]
+            elif kind == "NOT":
+                x = v[ins[0]] ^ 1
+            elif kind == "LUT":
+                x = table >> sum(v[i] << n for n, i in enumerate(ins)) & 1
+            else:
+                x = 0
+                for i in ins:
+                    x |= v[i]
+            if v[out] != x:
+                v[out] = x
+                self._touch(out)
+        self.events += events
+        self._show()
+        return events
+
+
+def evaluate_bits(netlist, inputs, width=64):
+    netlist = load(netlist)
+    mask = (1 << width) - 1
+    v = [0] * netlist.size
+    for n, lane in inputs.items():
+        v[netlist.inputs[n]] = lane & mask
+    for level in netlist.levels():
+        for g in level:
+            ins = g.ins
+            if g.kind == "AND":
+                v[g.out] = v[ins[0]] & v[ins[1]]
+            elif g.kind == "OR":
+                v[g.out] = v[ins[0]] | v[ins[1]]
+            elif g.kind == "NOT":
+                v[g.out] = v[ins[0]] ^ mask
+            elif g.kind == "LUT":
+                x = 0
+                for row in range(1 << len(ins)):
+                    if g.table >> row & 1:
+                        term = mask
+                        for n, i in enumerate(ins):
+                            term &= v[i] if row >> n & 1 else v[i] ^ mask
+                        x |= term
+                v[g.out] = x
+            else:
+                x = 0
+                for i in ins:
+                    x |= v[i]
+                v[g.out] = x
+    return {n: v[i] for n, i in netlist.outputs.items()}
+
+
+def _expression(g):
+    ins = [f"n{i}" for i in g.ins]
+    if g.kind == "AND":
+        return " & ".join(ins)
+    if g.kind == "OR":
+        return " | ".join(ins)
+    if g.kind == "NOT":
+        return f"{ins[0]} ^ mask"
+    if g.kind == "LUT":
+        terms = []
+        for row in range(1 << len(ins)):
+            if g.table >> row & 1:
+                term = [i if row >> n & 1 else f"({i} ^ mask)" for n, i in enumerate(ins)]
+                terms.append(" & ".join(term) or "mask")
+        return " | ".join(f"({t})" for t in terms) or "0"
+    return " | ".join(ins) or "0"
+
+
+def compile_to_python(netlist):
+    netlist = load(netlist)
+    if netlist not in _FUNCTIONS:
+        driven = {g.out for g in netlist.gates}
+        used = {i for g in netlist.gates for i in g.ins} | set(netlist.outputs.values())
+        lines = [f"def {netlist.name}({', '.join([*netlist.inputs, 'mask=1'])}):"]
+        lines += [f"    n{i} = {n}" for n, i in netlist.inputs.items()]
+        lines += [f"    n{i} = 0" for i in sorted(used - driven - set(netlist.inputs.values()))]
+        lines += [f"    n{g.out} = {_expression(g)}" for level in netlist.levels() for g in level]
+        lines.append(f"    return {''.join(f'n{i}, ' for i in netlist.outputs.values())}")
+        source = "\n".join(lines) + "\n"
+        namespace = {}
+        exec(compile(source, f"<{netlist.name}>", "exec"), namespace)
+        function = namespace[netlist.name]
+        function.source = source
+        _FUNCTIONS[netlist] = function
+    return _FUNCTIONS[netlist]
+
+
+def lane(bit, width, start=0):
+    half = 1 << bit
+    if half >= width:
+        return (1 << width) - 1 if start & half else 0
+    x = ((1 << half) - 1) << half
+    period = 2 * half
+    while period < width:
+        x |= x << period
+        period *= 2
+    return x & ((1 << width) - 1)
+
+
+def exhaustive(netlist, width=1 << 12):
+    netlist = load(netlist)
+    n = len(netlist.inputs)
+    width = min(width, 1 << n)
+    for start in range(0, 1 << n, width):
+        inputs = {name: lane(n - k - 1, width, start) for k, name in enumerate(netlist.inputs)}
+        yield start, evaluate_bits(netlist, inputs, width)
+
+
+def _check_shard(circuit, reference, start, bits):
+    f = compile_to_python(circuit)
+    n = len(load(circuit).inputs)
+    width = 1 << bits
+    res = f(*[lane(n - k - 1, width, start) for k in range(n)], mask=(1 << width) - 1)
+    rows = zip(*(format(r, f"0{width}b")[::-1] for r in res))
+    prefix = tuple(start >> (n - k - 1) & 1 for k in range(n - bits))
+    decoded = {}
+    for low, row in zip(product((0, 1), repeat=bits), rows):
+        inputs = prefix + low
+        outputs = reference(*inputs)
+        if outputs is None:
+            continue
+        if row not in decoded:
+            decoded[row] = [int(c) for c in row]
+        if decoded[row] != (outputs if isinstance(outputs, list) else [outputs]):
+            return inputs, decoded[row], outputs
+    return None
+
+
+def verify(circuit, reference, workers=None, shard_bits=None):
+    n = len(load(circuit).inputs)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if shard_bits is None:
+        shard_bits = (4 * workers - 1).bit_length() if workers > 1 else 0
+    shard_bits = min(n, shard_bits)
+    bits = n - shard_bits
+    starts = [shard << bits for shard in range(1 << shard_bits)]
+    if workers <= 1:
+        for start in starts:
+            failure = _check_shard(circuit, reference, start, bits)
+            if failure is not None:
+                return failure
+        return None
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(_check_shard, circuit, reference, start, bits) for start in starts]
+        for future in futures:
+            failure = future.result()
+            if failure is not None:
+                for f in futures:
+                    f.cancel()
+                return failure
+    return None
+
+
+def _tables(kind, n, gates):
+    if kind != "LUT":
+        return None
+    return np.array([[g.table >> row & 1 for row in range(1 << n)] for g in gates], dtype=bool)
+
+
+def _plan(netlist):
+    if netlist not in _PLANS:
+        plan = []
+        for level in netlist.levels():
+            groups = {}
+            for g in level:
+                groups.setdefault((g.kind, len(g.ins)), []).append(g)
+            plan.append([
+                (kind, np.array([g.out for g in gates]), np.array([g.ins for g in gates]), _tables(kind, n, gates))
+                for (kind, n), gates in groups.items()
+            ])
+        _PLANS[netlist] = plan
+    return _PLANS[netlist]
+
+
+def evaluate_batch(netlist, inputs, chunk=1 << 14):
+    if np is None:
+        raise ImportError("evaluate_batch requires numpy")
+    netlist = load(netlist)
+    inputs = np.asarray(inputs, dtype=bool)
+    if inputs.ndim != 2 or inputs.shape[1] != len(netlist.inputs):
+        raise CircuitError(f"{netlist.name} expects an (N, {len(netlist.inputs)}) input array")
+    plan = _plan(netlist)
+    ins = list(netlist.inputs.values())
+    outs = list(netlist.outputs.values())
+    res = np.empty((len(inputs), len(outs)), dtype=np.uint8)
+    for start in range(0, len(inputs), chunk):
+        block = inputs[start:start + chunk]
+        v = np.zeros((netlist.size, len(block)), dtype=bool)
+        v[ins] = block.T
+        for level in plan:
+            for kind, out, src, tables in level:
+                if kind == "NOT":
+                    v[out] = ~v[src[:, 0]]
+                elif kind == "AND":
+                    v[out] = np.logical_and.reduce(v[src], axis=1)
+                elif kind == "LUT":
+                    row = np.zeros((len(out), len(block)), dtype=np.intp)
+                    for n in range(src.shape[1]):
+                        row |= v[src[:, n]].astype(np.intp) << n
+                    v[out] = np.take_along_axis(tables, row, axis=1)
+                else:
+                    v[out] = np.logical_or.reduce(v[src], axis=1)
+        res[start:start + chunk] = v[outs].T
+    return res
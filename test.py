@@ -1,41 +1,96 @@
+import atexit
+import gc
+import json
+import os
 import random
-from unittest import TestCase
+import shutil
+import sys
+import tempfile
+import tracemalloc
+from unittest import TestCase, skipIf
 from itertools import product
 
+if "ALU_NETLIST_CACHE" not in os.environ:
+    os.environ["ALU_NETLIST_CACHE"] = tempfile.mkdtemp(prefix="alu-netlists-")
+    atexit.register(shutil.rmtree, os.environ["ALU_NETLIST_CACHE"], True)
+
 from lib.utils import Display, CircuitError
-from lib.circuit import NOR, NAND, XOR, AND3, OR3, XNOR, ODD, MT1, HADD, \
+from lib.bench import compare, report, summarize
+from lib.core import C, Input, NetStore, Output
+from lib.netlist import _load_cached, flatten, load, merge_buffers, read, save, simplify, source_hash, strash
+from lib.sim import FlatCircuit, EventCircuit, compile_to_python, evaluate_bits, exhaustive, lane, np, verify
+from lib.circuit import Circuit, NOT, NOR, NAND, XOR, AND3, OR3, XNOR, ODD, MT1, HADD, \
     ADD, SC, NOT8, AND8, OR8, EQ8, NEQ8, GT8, LT8, GTE8, LTE8, ADD8, ALU
 
+WORKERS = int(os.environ.get("ALU_TEST_WORKERS", os.cpu_count() or 1))
+SEED = os.environ.get("ALU_TEST_SEED", "0")
+RATE = float(os.environ.get("ALU_TEST_RATE", "0.01"))
+LEGACY = int(os.environ.get("ALU_TEST_LEGACY", "64"))
+EDGES = (0, 1, 0x7f, 0x80, 0xfe, 0xff)
+
+
+def bits(n, width):
+    return tuple(n >> (width - k - 1) & 1 for k in range(width))
+
 
 class BaseTest(TestCase):
     IN = 0
     OUT = 0
+    STRATA = 0
     CIRCUIT = None
 
     @staticmethod
     def F(*args):
         return None
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.init_tm()
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.init_tm()
 
-    def init_tm(self):
-        self.TM = {}
-        for i in product((0, 1), repeat=self.IN):
-            if self.IN >= 10:
-                if random.random() > 0.01:
-                    continue
-            self.TM[i] = self.F(*i)
+    @classmethod
+    def tearDownClass(cls):
+        del cls.TM
+        super().tearDownClass()
 
-    def init_circuit(self, inputs):
+    @classmethod
+    def init_tm(cls):
+        if cls.IN < 10:
+            cls.TM = {i: cls.F(*i) for i in product((0, 1), repeat=cls.IN)}
+            return
+        rng = random.Random(f"{SEED}:{cls.__name__}")
+        low = cls.IN - cls.STRATA
+        vectors = set()
+        for prefix in product((0, 1), repeat=cls.STRATA):
+            for n in rng.sample(range(1 << low), max(1, round(RATE * (1 << low)))):
+                vectors.add(prefix + bits(n, low))
+            if low % 8 == 0:
+                for values in product(EDGES, repeat=low // 8):
+                    vectors.add(prefix + sum((bits(v, 8) for v in values), ()))
+        cls.TM = {i: cls.F(*i) for i in sorted(vectors)}
+
+    def coverage(self):
+        strata = {}
+        outputs = [[0, 0] for _ in range(self.OUT)]
+        for inputs, res in self.TM.items():
+            strata[inputs[:self.STRATA]] = strata.get(inputs[:self.STRATA], 0) + 1
+            if res is None:
+                continue
+            for k, bit in enumerate(res if isinstance(res, list) else [res]):
+                outputs[k][int(bit)] += 1
+        return strata, outputs
+
+    def init_circuit(self, inputs, flat=False):
         d = Display(self.OUT)
         kwargs = {}
         for i in range(self.IN):
             kwargs[f'in{i + 1}'] = inputs[i]
         for i in range(self.OUT):
             kwargs[f'out{i + 1}'] = getattr(d, f"c{i + 1}")
-        c = self.CIRCUIT(**kwargs)
+        if flat:
+            c = FlatCircuit(self.CIRCUIT, **kwargs)
+        else:
+            c = self.CIRCUIT(**kwargs)
         return c, d
 
     def test(self):
@@ -43,14 +98,463 @@ class BaseTest(TestCase):
             return
         if not self.CIRCUIT.ELEMENTS:
             raise CircuitError("Empty scheme")
-        for inputs, outputs in self.TM.items():
-            if outputs is None:
-                continue
-            c, d = self.init_circuit(inputs)
+        c = None
+        for inputs, outputs in self.legacy_vectors():
+            if c is None:
+                c, d = self.init_circuit(inputs)
+            else:
+                c.set_inputs(**{f'in{i + 1}': inputs[i] for i in range(self.IN)})
             c.run()
             if not d.check(outputs):
                 raise Exception(f"Input: {inputs}, output: {d.res()}, correct: {outputs}")
 
+    def test_coverage(self):
+        if not self.CIRCUIT:
+            return
+        strata, outputs = self.coverage()
+        self.assertEqual(len(strata), 1 << self.STRATA)
+        if os.environ.get("ALU_TEST_COVERAGE"):
+            lines = [f"{type(self).__name__}: {len(self.TM)} of {1 << self.IN} vectors (seed {SEED})"]
+            if self.STRATA:
+                for prefix, n in sorted(strata.items()):
+                    name = "".join(map(str, prefix))
+                    lines.append(f"  in1..in{self.STRATA}={name}: {n} of {1 << (self.IN - self.STRATA)}")
+            for k, (zeros, ones) in enumerate(outputs):
+                lines.append(f"  out{k + 1}: {zeros} zeros, {ones} ones")
+            print("\n".join(lines), file=sys.stderr)
+
+    def test_levelized(self):
+        if not self.CIRCUIT:
+            return
+        vectors = [(i, o) for i, o in self.TM.items() if o is not None]
+        for inputs, outputs in vectors if self.IN < 10 else vectors[::len(vectors) // 16]:
+            c, d = self.init_circuit(inputs)
+            self.assertEqual(c.run_levelized(), 1)
+            if not d.check(outputs):
+                raise Exception(f"Input: {inputs}, output: {d.res()}, correct: {outputs}")
+            settled = c.read_outputs()
+            c.update()
+            self.assertEqual(c.read_outputs(), settled)
+            self.assertEqual(c.run(), 1)
+
+    def vectors(self):
+        return [(i, o) for i, o in self.TM.items() if o is not None]
+
+    def legacy_vectors(self):
+        vectors = self.vectors()
+        if self.IN < 10:
+            return vectors
+        strata = {}
+        for inputs, outputs in vectors:
+            strata.setdefault(inputs[:self.STRATA], []).append((inputs, outputs))
+        n = max(1, LEGACY >> self.STRATA)
+        return [v for group in strata.values() for v in group[::max(1, len(group) // n)][:n]]
+
+    def check_outputs(self, vectors, rows):
+        for (inputs, outputs), row in zip(vectors, rows):
+            d = Display(self.OUT)
+            for k, value in enumerate(row):
+                getattr(d, f"c{k + 1}").value = value
+            if not d.check(outputs):
+                raise Exception(f"Input: {inputs}, output: {d.res()}, correct: {outputs}")
+
+    def step(self, c, vectors):
+        for inputs, outputs in vectors:
+            c.set_inputs(**{f'in{k + 1}': v for k, v in enumerate(inputs)})
+            c.run()
+            yield c.read_outputs()
+
+    def test_flat(self):
+        if not self.CIRCUIT:
+            return
+        vectors = self.vectors()
+        self.check_outputs(vectors, self.step(FlatCircuit(self.CIRCUIT), vectors))
+
+    def test_event(self):
+        if not self.CIRCUIT:
+            return
+        vectors = self.vectors()
+        self.check_outputs(vectors, self.step(EventCircuit(self.CIRCUIT), vectors))
+
+    def test_bits(self):
+        if not self.CIRCUIT:
+            return
+        vectors = self.vectors()
+        inputs = {}
+        for k in range(self.IN):
+            inputs[f'in{k + 1}'] = sum(int(i[k]) << j for j, (i, o) in enumerate(vectors))
+        res = list(evaluate_bits(self.CIRCUIT, inputs, len(vectors)).values())
+        self.check_outputs(vectors, ([r >> j & 1 for r in res] for j in range(len(vectors))))
+
+    def test_compiled(self):
+        if not self.CIRCUIT:
+            return
+        f = compile_to_python(self.CIRCUIT)
+        vectors = self.vectors()
+        self.check_outputs(vectors, (f(*inputs) for inputs, outputs in vectors))
+
+    def test_exhaustive(self):
+        if not self.CIRCUIT:
+            return
+        failure = verify(self.CIRCUIT, self.F, workers=WORKERS)
+        if failure is not None:
+            raise Exception("Input: {}, output: {}, correct: {}".format(*failure))
+
+    @skipIf(np is None, "numpy is not installed")
+    def test_batch(self):
+        if not self.CIRCUIT:
+            return
+        vectors = self.vectors()
+        res = self.CIRCUIT.evaluate_batch(np.array([i for i, o in vectors], dtype=np.uint8))
+        self.assertEqual(res.shape, (len(vectors), self.OUT))
+        self.check_outputs(vectors, res.tolist())
+
+
+class RING(Circuit):
+    ELEMENTS = {
+        NOT: ("n1",)
+    }
+
+    def inout(self):
+        return {
+            "out1": self.n1.out1
+        }
+
+    def connect(self):
+        return (
+            (self.n1.out1, self.n1.in1),
+        )
+
+
+class TestCore(TestCase):
+    def test_contacts(self):
+        store = NetStore()
+        a, b, i, j = Output(store), Output(store), Input(store), Input()
+        c = C(a, b, i)
+        a.value, b.value, j.value = 0, 1, 1
+        c.update()
+        i.update()
+        j.update()
+        self.assertEqual((c.value, i.value, j.value), (1, 1, 1))
+        b.value = 0
+        c.update()
+        i.update()
+        self.assertEqual(i.value, 0)
+        with self.assertRaises(CircuitError):
+            C(a, j)
+
+    def test_separate_stores(self):
+        a, b = ADD(in1=1, in2=1, in3=0), ADD(in1=0, in2=0, in3=0)
+        self.assertIsNot(a._store, b._store)
+        self.assertTrue(all(e._store is a._store for e in a.walk()))
+        a.run()
+        b.run()
+        self.assertEqual((a.read_outputs(), b.read_outputs()), ([0, 1], [0, 0]))
+
+    def test_element_state(self):
+        class Counted(NOT):
+            made = 0
+
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                Counted.made += 1
+
+        class Pair(Circuit):
+            ELEMENTS = {Counted: ("n1", "n2")}
+
+            def inout(self):
+                return {"in1": self.n1.in1, "out1": self.n2.out1}
+
+            def connect(self):
+                return [(self.n1.out1, self.n2.in1)]
+
+        c = Pair(in1=0)
+        self.assertEqual(Counted.made, 2)
+        c.run()
+        self.assertEqual(c.read_outputs(), [0])
+        self.assertIs(c.n1._outputs, Pair(in1=1).n2._outputs)
+        for e in (c.n1, c.n2):
+            self.assertFalse({"_init", "_flat", "_wires", "_root"} & set(vars(e)))
+
+
+class TestRun(TestCase):
+    def test_settle(self):
+        d = Display(1)
+        c = NOR(in1=0, in2=0, out1=d.c1)
+        ticks = c.run()
+        self.assertLess(ticks, 10)
+        self.assertEqual(d.res(), 1)
+        self.assertEqual(c.run(), 1)
+
+    def test_settle_ticks(self):
+        self.assertEqual(NOR.settle_ticks(), 3)
+        self.assertLess(ODD.settle_ticks(), GT8.settle_ticks())
+        self.assertEqual(RING.settle_ticks(), 100)
+        c = MT1()
+        for inputs in product((0, 1), repeat=4):
+            c.set_inputs(**{f"in{k + 1}": v for k, v in enumerate(inputs)})
+            self.assertLessEqual(c.run(strict=True), MT1.settle_ticks())
+            self.assertEqual(c.read_outputs(), [int(TestMT1.F(*inputs))])
+
+    def test_reuse(self):
+        c = ADD(in1=1, in2=1, in3=0)
+        c.run()
+        self.assertEqual(c.read_outputs(), [0, 1])
+        c.set_inputs(in3=1)
+        c.run()
+        self.assertEqual(c.read_outputs(), [1, 1])
+        c.reset()
+        self.assertEqual(c.read_outputs(), [0, 0])
+        c.run()
+        self.assertEqual(c.read_outputs(), [1, 1])
+        for name in ("in4", "inout", "out1"):
+            with self.assertRaises(CircuitError):
+                c.set_inputs(**{name: 1})
+
+    def test_oscillation(self):
+        for c in (RING(), FlatCircuit(RING)):
+            self.assertEqual(c.run(max_ticks=10), 10)
+            self.assertEqual(c.run(n=7), 7)
+            with self.assertRaises(CircuitError):
+                c.run(max_ticks=10, strict=True)
+
+
+class TestNetlistCache(TestCase):
+    def test_netlist_cache(self):
+        self.assertIs(ALU.netlist(), ALU.netlist())
+        self.assertIsNot(ALU.netlist(), flatten(ALU))
+        a, b = FlatCircuit(ALU), FlatCircuit(ALU)
+        self.assertIs(a.netlist, b.netlist)
+        a.values[0] = 1
+        self.assertEqual(b.values[0], 0)
+
+    def test_netlist_file(self):
+        netlist = flatten(ADD8)
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "ADD8.net")
+            save(netlist, path)
+            loaded = read(path)
+        self.assertEqual(loaded.name, netlist.name)
+        self.assertEqual(loaded.size, netlist.size)
+        self.assertEqual(loaded.inputs, netlist.inputs)
+        self.assertEqual(loaded.outputs, netlist.outputs)
+        self.assertEqual([repr(g) for g in loaded.gates], [repr(g) for g in netlist.gates])
+        self.assertEqual(source_hash(ADD8), source_hash(ADD8))
+        self.assertNotEqual(source_hash(ADD8), source_hash(ADD))
+        self.assertNotEqual(source_hash(ADD8, 4), source_hash(ADD8))
+
+    def test_netlist_file_corrupt(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "ADD8.net")
+            save(load(ADD8), path)
+            with open(path, "rb") as f:
+                data = f.read()
+            for broken in (data[:-3000], data[:-1], data + b"\0"):
+                with open(path, "wb") as f:
+                    f.write(broken)
+                with self.assertRaises(CircuitError):
+                    read(path)
+
+    def test_netlist_file_names(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "NOR.net")
+            for name, port in (("__import__('os').system('x') or NOR", "in1"),
+                               ("NOR", "in1=__import__('os').system('x')"),
+                               ("NOR", "out1")):
+                netlist = flatten(NOR)
+                netlist.name = name
+                netlist.inputs = {port if n == "in1" else n: net for n, net in netlist.inputs.items()}
+                save(netlist, path)
+                with self.assertRaises(CircuitError):
+                    read(path)
+
+    def test_netlist_cache_prune(self):
+        with tempfile.TemporaryDirectory() as d:
+            os.environ["ALU_NETLIST_CACHE"], cache = d, os.environ["ALU_NETLIST_CACHE"]
+            try:
+                for name in ("ADD8-0123456789abcdef.net", "ADD8-lut4-0123456789abcdef.net"):
+                    open(os.path.join(d, name), "wb").close()
+                netlist = _load_cached(ADD8, 0)
+                self.assertEqual(sorted(os.listdir(d)), sorted([f"ADD8-{source_hash(ADD8)}.net",
+                                                                "ADD8-lut4-0123456789abcdef.net"]))
+                self.assertEqual([repr(g) for g in _load_cached(ADD8, 0).gates], [repr(g) for g in netlist.gates])
+            finally:
+                os.environ["ALU_NETLIST_CACHE"] = cache
+
+
+class TestNetlistPasses(TestCase):
+    def test_lut(self):
+        for cls in (HADD, ADD8, GT8):
+            netlist = load(cls, lut_inputs=4)
+            self.assertLess(len(netlist.gates), len(load(cls).gates))
+            self.assertEqual(list(exhaustive(netlist)), list(exhaustive(cls)))
+        netlist = load(ADD8, lut_inputs=4)
+        self.assertEqual(sum(g.kind == "LUT" for g in netlist.gates), 16)
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "ADD8.net")
+            save(netlist, path)
+            self.assertEqual([repr(g) for g in read(path).gates], [repr(g) for g in netlist.gates])
+        c = FlatCircuit(netlist, **{f'in{i + 1}': 1 for i in range(16)})
+        c.run()
+        self.assertEqual(c.read_outputs(), [0] + [1] * 8)
+
+    def test_merge_buffers(self):
+        for cls in (XOR, GT8, ADD8):
+            netlist = flatten(cls)
+            merged = merge_buffers(netlist)
+            self.assertFalse(any(g.kind == "Bridge" for g in merged.gates))
+            self.assertLess(len(merged.levels()), len(netlist.levels()))
+            self.assertEqual((merged.inputs, merged.outputs), (netlist.inputs, netlist.outputs))
+            self.assertEqual(list(exhaustive(merged)), list(exhaustive(netlist)))
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "ADD8.net")
+            save(merged, path)
+            self.assertEqual(read(path).aliases, merged.aliases)
+
+    def test_strash(self):
+        for cls in (GT8, ADD8):
+            merged = merge_buffers(flatten(cls))
+            hashed = strash(merged)
+            self.assertLess(len(hashed.gates), len(merged.gates))
+            keys = [(g.kind, tuple(sorted(g.ins)), g.table) for g in hashed.gates]
+            self.assertEqual(len(set(keys)), len(keys))
+            self.assertEqual(list(exhaustive(hashed)), list(exhaustive(cls)))
+        self.assertEqual(len(strash(load(ALU)).gates), len(load(ALU).gates))
+
+    def test_simplify(self):
+        for cls in (HADD, GT8, ADD8):
+            self.assertEqual(list(exhaustive(simplify(cls))), list(exhaustive(cls)))
+        full = dict(exhaustive(ALU, width=1 << 16))
+        for op in range(10):
+            netlist = simplify(ALU, **{f"in{k + 1}": op >> (3 - k) & 1 for k in range(4)})
+            self.assertEqual(list(netlist.inputs), [f"in{k}" for k in range(5, 21)])
+            self.assertEqual(dict(exhaustive(netlist, width=1 << 16))[0], full[op << 16])
+        self.assertLess(len(netlist.gates) * 10, len(flatten(ALU).gates))
+        with self.assertRaises(CircuitError):
+            FlatCircuit(netlist).set_inputs(in1=1)
+
+    def test_stats(self):
+        stats = XOR.stats()
+        self.assertEqual(stats["gates"], {"AND": 2, "OR": 1, "NOT": 1, "Bridge": 2})
+        self.assertEqual(stats["depth"], {"out1": 3})
+        self.assertEqual(stats["critical_path"], ["XOR.b1", "XOR.na1.o1", "XOR.na1.n1", "XOR.a1"])
+        stats = ALU.stats()
+        kinds = {g.path: g.kind for g in flatten(ALU).gates if g.kind != "C"}
+        self.assertEqual(sum(stats["gates"].values()), len(kinds))
+        self.assertEqual(stats["max_fanout"], {"net": "ALU.b1", "fanout": 10})
+        logic = [p for p in stats["critical_path"] if kinds[p] != "Bridge"]
+        self.assertEqual(len(logic), max(stats["depth"].values()))
+        with self.assertRaises(CircuitError):
+            RING.stats()
+
+
+class TestSimulators(TestCase):
+    def test_event_cone(self):
+        c = EventCircuit(ADD8, **{f'in{i + 1}': 0 for i in range(16)})
+        full = c.run()
+        c.set_inputs(in8=1)
+        self.assertLess(c.run(), full)
+        self.assertEqual(c.values[c.netlist.outputs['out1']], 1)
+
+    def test_event_oscillation(self):
+        c = EventCircuit(RING)
+        self.assertEqual(c.run(max_ticks=10), 10 * len(c.netlist.gates))
+        with self.assertRaises(CircuitError):
+            c.run(n=10, strict=True)
+
+    def test_bits_exhaustive(self):
+        count = 0
+        for start, outs in exhaustive(ADD8, 1 << 12):
+            for j in range(1 << 12):
+                a, b = divmod(start + j, 256)
+                res = sum((outs[f'out{k + 1}'] >> j & 1) << k for k in range(9))
+                self.assertEqual(res, a + b)
+                count += 1
+        self.assertEqual(count, 1 << 16)
+
+    def test_compile_to_python(self):
+        f = compile_to_python(ALU)
+        self.assertIs(compile_to_python(ALU), f)
+        self.assertEqual(f(1, 0, 0, 1, *[1] * 16), (0,) + (1,) * 8)
+        width = 1 << 12
+        inputs = [lane(19 - k, width, 0) for k in range(20)]
+        outputs = f(*inputs, mask=(1 << width) - 1)
+        self.assertEqual(list(outputs), list(dict(exhaustive(ALU, width))[0].values()))
+        with self.assertRaises(CircuitError):
+            compile_to_python(RING)
+        pinned = simplify(NOR, in1=0, in2=0)
+        self.assertEqual(compile_to_python(pinned)(), (1,))
+        self.assertEqual(compile_to_python(pinned)(mask=15), (15,))
+
+    def test_verify(self):
+        self.assertIsNone(verify(ADD8, TestADD8.F, workers=2, shard_bits=3))
+        self.assertIsNone(verify(HADD, TestHADD.F, workers=1, shard_bits=5))
+
+        def wrong(*args):
+            outputs = TestHADD.F(*args)
+            return [1, 1] if args == (1, 0) or args == (1, 1) else outputs
+
+        self.assertEqual(verify(HADD, wrong, workers=1, shard_bits=1), ((1, 0), TestHADD.F(1, 0), [1, 1]))
+
+
+class TestBench(TestCase):
+    def test_bench(self):
+        res = json.loads(json.dumps(report(("NOR", "HADD"), budget=0.001)))
+        self.assertEqual(list(res["circuits"]), ["NOR", "HADD"])
+        nor = res["circuits"]["NOR"]
+        self.assertEqual(nor["settle_ticks"], 3)
+        self.assertLess(nor["construct_flat"]["median"], nor["construct"]["median"])
+        self.assertLessEqual(nor["ticks"]["max"], 3)
+        self.assertTrue({"legacy", "flat", "event", "bits", "compiled"} <= set(nor["vectors_per_second"]))
+
+    def test_construct_cost(self):
+        ALU()
+        calls = []
+        sys.setprofile(lambda frame, event, arg: calls.append(event == "call"))
+        try:
+            c = ALU()
+        finally:
+            sys.setprofile(None)
+        self.assertLessEqual(sum(calls), 9 * len(list(c.walk())))
+        gc.collect()
+        tracemalloc.start()
+        try:
+            c = ALU()
+            size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        self.assertLess(size, 1600 * 1024)
+
+    def test_bench_compare(self):
+        def run(tick, rate):
+            return {"circuits": {"ALU": {
+                "construct": summarize([1.0, 1.0, 1.0]),
+                "tick": summarize(tick),
+                "vectors_per_second": {"flat": summarize(rate)},
+            }}}
+
+        baseline = run([1.0, 1.1, 0.9], [100, 101, 99])
+        self.assertEqual(compare(baseline, baseline), [])
+        self.assertEqual(compare(baseline, run([1.1, 1.2, 1.0], [90, 95, 93])), [])
+        self.assertEqual(len(compare(baseline, run([2.0, 2.1, 1.9], [100, 101, 99]))), 1)
+        self.assertEqual(len(compare(baseline, run([1.0, 1.1, 0.9], [50, 51, 49]))), 1)
+        self.assertEqual(compare(baseline, run([1.4, 2.5, 0.3], [100, 101, 99]), threshold=0.3), [])
+
+
+class TestProfiler(TestCase):
+    def test_profile(self):
+        c = GT8(**{f"in{k + 1}": k % 3 == 0 for k in range(16)})
+        with c.profile() as p:
+            ticks = c.run()
+        self.assertFalse(any("update" in vars(e) for e in c.walk()))
+        self.assertEqual(p.stats["GT8"].calls, ticks)
+        self.assertEqual(p.stats["GT8.s3"].conductors, ticks * len(c.s3._conductors))
+        self.assertEqual(p.stats["GT8.s3.o1"].name, "OR")
+        rows = p.report()
+        self.assertEqual(rows, sorted(rows, key=lambda s: s.self, reverse=True))
+        self.assertAlmostEqual(sum(s.self for s in rows), p.stats["GT8"].total, places=3)
+        self.assertEqual(sum(s.calls for s in p.by_class() if s.name == "SEG"), 7 * ticks)
+
 
 class TestNOR(BaseTest):
     IN = 2
@@ -279,6 +783,7 @@ class TestADD8(BaseTest):
 class TestALU(BaseTest):
     IN = 20
     OUT = 9
+    STRATA = 4
     CIRCUIT = ALU
     TESTS = {
         0: TestNOT8,